@@ -1,93 +1,223 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from dash import Dash, html, dcc, Input, Output, State
+from dash import Dash, html, dcc, Input, Output, State, callback_context, no_update
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly.express as px
 import dash_daq as daq
 from PIL import Image
+import hashlib
+import inspect
+import json
 import os
+import pickle
+import tempfile
+
+# Source data and the warm-start snapshot of everything derived from it
+SOURCE_FILES = ["CleanedData/player_stats_cleaned.csv", "CleanedData/player_radar.csv"]
+SNAPSHOT_PATH = os.path.join(".cache", "app_state.pkl")
+SNAPSHOT_VERSION = 2  # Bump only when the layout of the snapshot file itself changes
+
+# Weights of the composite performance scores
+PERFORMANCE_WEIGHTS = {
+    'passing_commulative_performance': {
+        'passes_completed': 0.05,
+        'assists': 1.5,
+        'assisted_shots': 1.5,
+        'passes_into_final_third': 0.2,
+        'passes_into_penalty_area': 0.4,
+        'crosses_into_penalty_area': 0.3,
+        'progressive_passes': 0.1
+    },
+    'shooting_commulative_performance': {
+        'goals': 3,
+        'shots_on_target': 0.7,
+        'shots': 0.6,
+        'shots_free_kicks': 0.4,
+        'pens_made': 1
+    },
+    'defence_commulative_performance': {
+        'dribbled_past': -0.2,
+        'errors': -1,
+        'blocks': 0.5,
+        'blocked_shots': 0.75,
+        'blocked_passes': 0.75,
+        'tackles_interceptions': 1,
+        'clearances': 0.2
+    },
+    'possession_commulative_performance': {
+        'touches': 0.05,
+        'touches_att_3rd': 0.2,
+        'touches_att_pen_area': 0.5,
+        'dribbles_completed': 1,
+        'progressive_passes_received': 0.1,
+        'miscontrols': -0.2,
+        'dispossessed': -0.5
+    }
+}
+
+# Limits for players picked from the scatter plot
+MAX_SELECTED_PLAYERS = 100  # Oversized lassos keep their best performers, otherwise the oldest picks go
+BAR_CHART_TOP_N = 20  # Larger selections show the top players plus the average of the rest
+
+# Metric correlations used to rank the scatter/bar metric options and suggest axis pairs
+SUGGESTED_AXES_COUNT = 10
+SUGGESTED_AXES_MAX_CORRELATION = 0.95  # Skip near-duplicate pairs such as goals vs. goals_per90
+
+
+def compute_metric_correlations(data, positions):
+    """Rank the metrics and suggest axis pairs from the absolute correlations within a position subset."""
+    subset = data[data['position'].isin(positions)] if positions else data
+    metric_columns = data[data.columns[4:]].select_dtypes('number').columns
+
+    # Mean-impute missing values so the whole matrix comes out of a single matrix product
+    values = subset[metric_columns].astype(float)
+    centered = (values - values.mean()).fillna(0).to_numpy()
+    norms = np.sqrt((centered ** 2).sum(axis=0))
+    normalized = np.divide(centered, norms, out=np.zeros_like(centered), where=norms > 0)
+    matrix = np.abs(normalized.T @ normalized)
+    np.fill_diagonal(matrix, 0)
+
+    # Rank metrics by how strongly they relate to the rest; non-numeric columns go last
+    relevance = pd.Series(matrix.sum(axis=1) / max(len(metric_columns) - 1, 1), index=metric_columns)
+    ordered_metrics = sorted(data.columns[4:], key=lambda col: -relevance.get(col, -1))
+
+    upper = np.triu(matrix, k=1)
+    upper[upper >= SUGGESTED_AXES_MAX_CORRELATION] = 0
+    top_pairs = np.argsort(upper, axis=None)[::-1][:SUGGESTED_AXES_COUNT]
+    suggestion_options = []
+    for row, col in zip(*np.unravel_index(top_pairs, upper.shape)):
+        if upper[row, col] > 0:
+            metric_x, metric_y = metric_columns[row], metric_columns[col]
+            suggestion_options.append({'label': f'{metric_x} vs. {metric_y} (|r| = {upper[row, col]:.2f})',
+                                       'value': f'{metric_x}|{metric_y}'})
+
+    return {
+        'metric_options': [{'label': col, 'value': col} for col in ordered_metrics],
+        'suggestion_options': suggestion_options
+    }
 
-# Load your data
-df_radar = pd.read_csv("CleanedData/player_radar.csv")
-df_stats = pd.read_csv("CleanedData/player_stats_cleaned.csv")
-
-# Merge the datasets on the 'player' column without adding suffixes
-merged_df = pd.merge(df_stats, df_radar, on='player', how='outer', suffixes=('', '_drop'))
-
-# Drop columns with duplicate names from the second dataframe
-df = merged_df.drop(merged_df.filter(regex='_drop$').columns, axis=1)
-
-df_merged = df.copy()
-
-# Calculate performance metrics
-df_merged['passing_commulative_performance'] = (
-        0.05 * df_merged['passes_completed'] +
-        1.5 * df_merged['assists'] +
-        1.5 * df_merged['assisted_shots'] +
-        0.2 * df_merged['passes_into_final_third'] +
-        0.4 * df_merged['passes_into_penalty_area'] +
-        0.3 * df_merged['crosses_into_penalty_area'] +
-        0.1 * df_merged['progressive_passes']
-)
-
-df_merged['shooting_commulative_performance'] = (
-        3 * df_merged['goals'] +
-        0.7 * df_merged['shots_on_target'] +
-        0.6 * df_merged['shots'] +
-        0.4 * df_merged['shots_free_kicks'] +
-        df_merged['pens_made']
-)
 
-df_merged['defence_commulative_performance'] = (
-        -0.2 * df_merged['dribbled_past'] -
-        df_merged['errors'] +
-        0.5 * df_merged['blocks'] +
-        0.75 * df_merged['blocked_shots'] +
-        0.75 * df_merged['blocked_passes'] +
-        df_merged['tackles_interceptions'] +
-        0.2 * df_merged['clearances']
-)
+def build_metric_correlations(data):
+    """Precompute the correlations for all players and every single position."""
+    correlations = {(): compute_metric_correlations(data, ())}
+    for position in data['position'].dropna().unique():
+        correlations[(position,)] = compute_metric_correlations(data, (position,))
+    return correlations
+
+
+def get_metric_correlations(selected_positions):
+    # Multi-position filters are computed once on first use and cached alongside the precomputed ones
+    key = tuple(sorted(selected_positions)) if selected_positions else ()
+    if key not in metric_correlations:
+        metric_correlations[key] = compute_metric_correlations(df, key)
+    return metric_correlations[key]
+
+
+def build_app_state():
+    """Load the source data and derive everything the layout and callbacks need."""
+    df_stats = pd.read_csv(SOURCE_FILES[0])
+    df_radar = pd.read_csv(SOURCE_FILES[1])
+
+    # Merge the datasets on the 'player' column without adding suffixes
+    merged_df = pd.merge(df_stats, df_radar, on='player', how='outer', suffixes=('', '_drop'))
+
+    # Drop columns with duplicate names from the second dataframe
+    data = merged_df.drop(merged_df.filter(regex='_drop$').columns, axis=1)
+
+    # Calculate performance metrics
+    scored = data.copy()
+    for score, weights in PERFORMANCE_WEIGHTS.items():
+        scored[score] = sum(weight * scored[metric] for metric, weight in weights.items())
+    scored['total_performance'] = scored[list(PERFORMANCE_WEIGHTS)].sum(axis=1, skipna=False)
+
+    return {
+        'df': data,
+        'df_merged': scored,
+        # Determine the best player based on total performance
+        'best_player_overall': scored.loc[scored['total_performance'].idxmax()],
+        # Calculate the average performance metrics for all players
+        'average_performance': scored[list(PERFORMANCE_WEIGHTS)].mean(),
+        'team_options': [{'label': team, 'value': team} for team in data['team'].dropna().unique()],
+        'position_options': [{'label': position, 'value': position} for position in
+                             data['position'].dropna().unique()],
+        'player_options': [{'label': player, 'value': player} for player in data['player'].dropna().unique()],
+        'metric_correlations': build_metric_correlations(data)
+    }
 
-df_merged['possession_commulative_performance'] = (
-        0.05 * df_merged['touches'] +
-        0.2 * df_merged['touches_att_3rd'] +
-        0.5 * df_merged['touches_att_pen_area'] +
-        1 * df_merged['dribbles_completed'] +
-        0.1 * df_merged['progressive_passes_received'] +
-        -0.2 * df_merged['miscontrols'] +
-        -0.5 * df_merged['dispossessed']
-)
 
-df_merged['total_performance'] = (
-        df_merged['passing_commulative_performance'] +
-        df_merged['shooting_commulative_performance'] +
-        df_merged['defence_commulative_performance'] +
-        df_merged['possession_commulative_performance']
-)
+def snapshot_key():
+    # Any change to the source data, the code deriving the state, the scoring configuration or the
+    # pandas/numpy versions invalidates the snapshot
+    digest = hashlib.sha256()
+    for path in SOURCE_FILES:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    for function in (build_app_state, build_metric_correlations, compute_metric_correlations):
+        digest.update(inspect.getsource(function).encode())
+    config = [PERFORMANCE_WEIGHTS, SUGGESTED_AXES_COUNT, SUGGESTED_AXES_MAX_CORRELATION, pd.__version__,
+              np.__version__]
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def load_app_state():
+    """Return the derived state from the snapshot, rebuilding and rewriting it when missing or stale."""
+    key = snapshot_key()
+    header = {'version': SNAPSHOT_VERSION, 'key': key}
+    try:
+        # The small header record is checked first, so a stale state record is never unpickled
+        with open(SNAPSHOT_PATH, 'rb') as f:
+            if pickle.load(f) == header:
+                return pickle.load(f)
+    except Exception:
+        pass  # Missing, corrupt or unreadable snapshot, rebuild it below
+
+    state = build_app_state()
+    try:
+        os.makedirs(os.path.dirname(SNAPSHOT_PATH), exist_ok=True)
+        # Each process writes its own temp file, so concurrent workers never write to the same file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(SNAPSHOT_PATH), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, SNAPSHOT_PATH)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    except OSError:
+        pass  # Read-only checkout, serve the freshly built state without caching it
+    return state
+
+
+app_state = load_app_state()
+df = app_state['df']
+df_merged = app_state['df_merged']
+best_player_overall = app_state['best_player_overall']
+average_performance = app_state['average_performance']
+metric_correlations = app_state['metric_correlations']
 
-# Determine the best player based on total performance
-best_player_overall = df_merged.loc[df_merged['total_performance'].idxmax()]
 default_team = 'Argentina'  # Set to 'Argentina' to show Argentina players initially
 default_highlighted_player = best_player_overall['player']
+player_performance = df_merged.drop_duplicates('player').set_index('player')['total_performance']
 
-# Calculate the average performance metrics for all players
-average_performance = df_merged[
-    ['defence_commulative_performance', 'passing_commulative_performance', 'shooting_commulative_performance',
-     'possession_commulative_performance']].mean()
-
-# Resize the image
+# Resize the image, unless the resized copy in the assets folder is already up to date
 image_path = "CleanedData/other.png"
-image = Image.open(image_path)
-resized_image = image.resize((300, 300))  # Resize to 300x300 for better fit
-
-# Save the resized image to the assets folder
 assets_folder = "assets"
-os.makedirs(assets_folder, exist_ok=True)
 resized_image_path = os.path.join(assets_folder, "resized_other.png")
-resized_image.save(resized_image_path)
+if not os.path.exists(resized_image_path) or os.path.getmtime(resized_image_path) < os.path.getmtime(image_path):
+    image = Image.open(image_path)
+    resized_image = image.resize((300, 300))  # Resize to 300x300 for better fit
+
+    # Save the resized image to the assets folder
+    os.makedirs(assets_folder, exist_ok=True)
+    resized_image.save(resized_image_path)
 
 # Initialize the Dash app
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+server = app.server  # Exposed for WSGI servers, e.g. gunicorn -w 4 app:server
 
 app.layout = html.Div(
     style={'backgroundColor': '#2c3e50', 'minHeight': '100vh'},  # Dark background color for the entire page
@@ -99,7 +229,7 @@ app.layout = html.Div(
                     html.Label('Select team:', style={'fontWeight': 'bold', 'color': '#ecf0f1'}),  # Light text color
                     dcc.Dropdown(
                         id='team-dropdown',
-                        options=[{'label': team, 'value': team} for team in df_merged['team'].dropna().unique()],
+                        options=app_state['team_options'],
                         placeholder="Select a team",
                         clearable=True,
                         value=default_team,  # Set the default to 'Argentina'
@@ -165,7 +295,7 @@ app.layout = html.Div(
                 dbc.Col(html.Div([
                     dcc.Dropdown(
                         id='team-dropdown-2',
-                        options=[{'label': team, 'value': team} for team in df['team'].dropna().unique()],
+                        options=app_state['team_options'],
                         multi=True,
                         placeholder="Filter by Team",
                         style={'backgroundColor': '#2c3e50', 'color': '#ecf0f1'},  # Dark background for dropdown
@@ -176,8 +306,7 @@ app.layout = html.Div(
                 dbc.Col(html.Div([
                     dcc.Dropdown(
                         id='position-dropdown',
-                        options=[{'label': position, 'value': position} for position in
-                                 df['position'].dropna().unique()],
+                        options=app_state['position_options'],
                         multi=True,
                         placeholder="Filter by Position",
                         searchable=True,
@@ -189,13 +318,14 @@ app.layout = html.Div(
                 dbc.Col(html.Div([
                     dcc.Dropdown(
                         id='player-dropdown-2',
-                        options=[{'label': player, 'value': player} for player in df['player'].dropna().unique()],
+                        options=app_state['player_options'],
                         multi=True,
                         placeholder="Select Players",
                         clearable=True,
                         style={'backgroundColor': '#2c3e50', 'color': '#ecf0f1'},  # Dark background for dropdown
                         className='custom-dropdown'
-                    )
+                    ),
+                    html.Div(id='selection-note', style={'color': '#ecf0f1', 'fontSize': '12px', 'marginTop': '4px'})
                 ], style={'margin': '10px'}), width=3),
             ]),
 
@@ -203,7 +333,7 @@ app.layout = html.Div(
                 dbc.Col(html.Div([
                     dcc.Dropdown(
                         id='metric_x-dropdown',
-                        options=[{'label': col, 'value': col} for col in df.columns[4:]], value='shots',
+                        options=get_metric_correlations(None)['metric_options'], value='shots',
                         multi=False,
                         placeholder="Select a metric for x-axis",
                         clearable=True,
@@ -215,7 +345,7 @@ app.layout = html.Div(
                 dbc.Col(html.Div([
                     dcc.Dropdown(
                         id='metric_y-dropdown',
-                        options=[{'label': col, 'value': col} for col in df.columns[4:]], value='xg',
+                        options=get_metric_correlations(None)['metric_options'], value='xg',
                         multi=False,
                         placeholder="Select a metric for y-axis",
                         clearable=True,
@@ -223,6 +353,18 @@ app.layout = html.Div(
                         className='custom-dropdown'
                     )
                 ], style={'margin': '10px'}), width=3),
+
+                dbc.Col(html.Div([
+                    dcc.Dropdown(
+                        id='suggested-axes-dropdown',
+                        options=get_metric_correlations(None)['suggestion_options'],
+                        multi=False,
+                        placeholder="Suggested axes",
+                        clearable=True,
+                        style={'backgroundColor': '#2c3e50', 'color': '#ecf0f1'},  # Dark background for dropdown
+                        className='custom-dropdown'
+                    )
+                ], style={'margin': '10px'}), width=3),
             ]),
 
             dbc.Row([
@@ -506,16 +648,28 @@ def update_radar_chart(selected_team, selected_players, highlighted_player):
 
 @app.callback(
     [Output('metric_x-dropdown', 'options'),
-     Output('metric_y-dropdown', 'options')],
-    [Input('position-dropdown', 'value')]
+     Output('metric_y-dropdown', 'options'),
+     Output('suggested-axes-dropdown', 'options'),
+     Output('suggested-axes-dropdown', 'value'),
+     Output('metric_x-dropdown', 'value'),
+     Output('metric_y-dropdown', 'value')],
+    [Input('position-dropdown', 'value'),
+     Input('suggested-axes-dropdown', 'value')]
 )
-def update_metric_dropdowns(selected_position):
-    if selected_position:
-        available_metrics = df[df['position'].isin(selected_position)].columns[4:].tolist()
-        options = [{'label': metric, 'value': metric} for metric in available_metrics]
-    else:
-        options = [{'label': col, 'value': col} for col in df.columns[4:]]
-    return options, options
+def update_metric_dropdowns(selected_position, suggested_axes):
+    triggered = {trigger['prop_id'] for trigger in callback_context.triggered}
+
+    # Apply a picked suggestion, then clear it so the same pair can be picked again
+    if 'suggested-axes-dropdown.value' in triggered:
+        if not suggested_axes:
+            raise PreventUpdate
+        metric_x, metric_y = suggested_axes.split('|')
+        return no_update, no_update, no_update, None, metric_x, metric_y
+
+    # The position filter changed: re-rank the options and drop any stale suggestion
+    correlations = get_metric_correlations(selected_position)
+    options = correlations['metric_options']
+    return options, options, correlations['suggestion_options'], None, no_update, no_update
 
 
 @app.callback(
@@ -576,6 +730,7 @@ def update_scatter_plot(selected_teams, selected_positions, selected_players, se
         ))
 
     filtered_df = df.copy()
+    filtered_df['row_id'] = np.arange(len(df))  # Row positions let click/selection events resolve points back to rows
     if selected_teams:
         filtered_df = filtered_df[filtered_df['team'].isin(selected_teams)]
     if selected_positions:
@@ -590,7 +745,8 @@ def update_scatter_plot(selected_teams, selected_positions, selected_players, se
         selected_players = ['All Players']
 
     filtered_df['color'] = filtered_df['player'].map(color_map).fillna('lightgrey')
-    filtered_df['legend_group'] = filtered_df['player'].apply(lambda x: x if x in selected_players else 'All Players')
+    filtered_df['legend_group'] = filtered_df['player'].where(filtered_df['player'].isin(selected_players),
+                                                              'All Players')
 
     fig = px.scatter(
         filtered_df,
@@ -599,6 +755,7 @@ def update_scatter_plot(selected_teams, selected_positions, selected_players, se
         color='legend_group',
         color_discrete_map=color_map,
         hover_name='player',
+        custom_data=['row_id'],
         hover_data={
             'team': True,
             'position': True,
@@ -631,31 +788,57 @@ def update_scatter_plot(selected_teams, selected_positions, selected_players, se
 
 
 @app.callback(
-    Output('player-dropdown-2', 'value'),
+    [Output('player-dropdown-2', 'value'),
+     Output('selection-note', 'children')],
     [Input('scatter-plot', 'clickData'),
      Input('scatter-plot', 'selectedData')],
     [State('player-dropdown-2', 'value')]
 )
 def update_selected_players(clickData, selectedData, selected_players):
-    if selected_players is None:
-        selected_players = []
-
-    # Handle clickData
-    if clickData is not None:
-        clicked_player = clickData['points'][0]['hovertext']
-        if clicked_player in selected_players:
-            selected_players.remove(clicked_player)
-        else:
-            selected_players.append(clicked_player)
-
-    # Handle selectedData
-    if selectedData is not None:
-        for point in selectedData['points']:
-            selected_player = point['hovertext']
-            if selected_player not in selected_players:
-                selected_players.append(selected_player)
-
-    return selected_players
+    triggered = {trigger['prop_id'] for trigger in callback_context.triggered}
+    selection = dict.fromkeys(selected_players or [])  # Ordered set of the current selection
+
+    # Handle clickData: toggle the clicked player
+    if clickData is not None and 'scatter-plot.clickData' in triggered:
+        for clicked_player in players_from_points(clickData['points']):
+            if clicked_player in selection:
+                del selection[clicked_player]
+            else:
+                selection[clicked_player] = None
+
+    # Handle selectedData: add every lasso/box-selected player, moving re-selected ones to the end
+    note = ''
+    if selectedData is not None and 'scatter-plot.selectedData' in triggered:
+        lasso_players = players_from_points(selectedData['points'])
+        if len(lasso_players) > MAX_SELECTED_PLAYERS:
+            note = (f'Selection covered {len(lasso_players)} players; kept the top {MAX_SELECTED_PLAYERS} '
+                    f'by total performance')
+            lasso_players = top_players(lasso_players, MAX_SELECTED_PLAYERS)
+        for selected_player in lasso_players:
+            selection.pop(selected_player, None)
+            selection[selected_player] = None
+
+    # Drop the oldest picks so the event that just fired is never discarded
+    selected_players = list(selection)
+    if len(selected_players) > MAX_SELECTED_PLAYERS:
+        dropped = len(selected_players) - MAX_SELECTED_PLAYERS
+        selected_players = selected_players[dropped:]
+        note = note or f'Selection limited to {MAX_SELECTED_PLAYERS} players; dropped the {dropped} oldest picks'
+    return selected_players, note
+
+
+def top_players(players, count):
+    # Rank by tournament total performance; players without a score go last
+    ranked = player_performance.reindex(players).sort_values(ascending=False, na_position='last', kind='stable')
+    return ranked.index[:count].tolist()
+
+
+def players_from_points(points):
+    # Resolve scatter points to players through the row positions carried in customdata
+    row_ids = np.fromiter((point['customdata'][0] for point in points if point.get('customdata')), dtype=np.int64)
+    player_names = df['player'].to_numpy()
+    row_ids = row_ids[(row_ids >= 0) & (row_ids < len(player_names))]
+    return [player for player in pd.unique(player_names[row_ids]) if isinstance(player, str)]
 
 
 @app.callback(
@@ -699,6 +882,15 @@ def update_bar_chart(selected_teams, selected_positions, selected_players, selec
     grouped_df['total'] = grouped_df[selected_metric_x] + grouped_df[selected_metric_y]
     grouped_df = grouped_df.sort_values('total', ascending=False).drop(columns=['total'])
 
+    # Aggregate large selections into the top players plus the average of the rest
+    title = f'{selected_metric_x} vs. {selected_metric_y}'
+    if len(grouped_df) > BAR_CHART_TOP_N:
+        others = grouped_df.iloc[BAR_CHART_TOP_N:]
+        others_row = others[[selected_metric_x, selected_metric_y]].mean().to_frame().T
+        others_row.insert(0, 'player', f'Average of {len(others)} others')
+        title += f' (top {BAR_CHART_TOP_N} of {len(grouped_df)} players)'
+        grouped_df = pd.concat([grouped_df.iloc[:BAR_CHART_TOP_N], others_row], ignore_index=True)
+
     melted_df = pd.melt(grouped_df, id_vars=['player'], value_vars=[selected_metric_x, selected_metric_y],
                         var_name='Metric', value_name='Value')
 
@@ -707,7 +899,7 @@ def update_bar_chart(selected_teams, selected_positions, selected_players, selec
         x='player',
         y='Value',
         color='Metric',
-        title=f'{selected_metric_x} vs. {selected_metric_y}',
+        title=title,
         barmode='group' if barmode else 'stack',
         text_auto=True,
     )
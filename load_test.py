@@ -0,0 +1,479 @@
+"""Concurrent-session load test for the KickStats Dash callbacks.
+
+Replays scripted scout interactions by POSTing the same payloads the browser sends to
+``/_dash-update-component`` and reports throughput, tail latency and error rate per callback.
+
+Examples:
+    python load_test.py --start-server --sessions 50 --duration 60
+    python load_test.py --url http://127.0.0.1:8068 --sessions 100 --duration 120
+    python load_test.py --start-server --server-command "gunicorn -w 4 -b 127.0.0.1:8068 app:server"
+"""
+import argparse
+import array
+import asyncio
+import base64
+import json
+import random
+import shlex
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+CALLBACK_PATH = '/_dash-update-component'
+LAYOUT_PATH = '/_dash-layout'
+
+DEPENDENCIES_PATH = '/_dash-dependencies'
+MAX_CONNECTIONS_PER_SESSION = 6  # Browsers keep at most six connections per host
+MAX_CASCADE_ROUNDS = 20  # Guards against callback chains that never settle
+
+ACTION_WEIGHTS = {
+    'change_team': 3,
+    'highlight_player': 2,
+    'filter_teams': 2,
+    'filter_positions': 2,
+    'change_metric': 3,
+    'suggested_axes': 1,
+    'toggle_barmode': 1,
+    'click_point': 3,
+    'lasso_select': 1,
+}
+
+
+class Callback:
+    """A server-side callback as listed by the app's /_dash-dependencies endpoint."""
+
+    def __init__(self, spec):
+        self.output = spec['output']
+        self.multi = self.output.startswith('..')
+        outputs = self.output[2:-2].split('...') if self.multi else [self.output]
+        self.outputs = [output.split('@')[0] for output in outputs]  # Drop allow_duplicate suffixes
+        self.inputs = [f"{dep['id']}.{dep['property']}" for dep in spec.get('inputs', [])]
+        self.state = [f"{dep['id']}.{dep['property']}" for dep in spec.get('state', [])]
+        self.prevent_initial_call = spec.get('prevent_initial_call', False)
+        self.name = self.outputs[0] + (f' (+{len(self.outputs) - 1})' if len(self.outputs) > 1 else '')
+
+    def payload(self, values, changed):
+        def props(keys):
+            return [dict(zip(('id', 'property'), key.rsplit('.', 1)), value=values.get(key)) for key in keys]
+
+        output_specs = [dict(zip(('id', 'property'), output.rsplit('.', 1))) for output in self.outputs]
+        return {
+            'output': self.output,
+            'outputs': output_specs if self.multi else output_specs[0],
+            'inputs': props(self.inputs),
+            'changedPropIds': [key for key in changed if key in self.inputs],
+            'state': props(self.state),
+        }
+
+
+def load_callbacks(dependencies):
+    # Clientside and pattern-matching callbacks never reach the server with plain string ids
+    return [Callback(spec) for spec in dependencies if not spec.get('clientside_function')
+            and all(isinstance(dep['id'], str) for dep in spec.get('inputs', []) + spec.get('state', []))]
+
+
+def find_components(layout):
+    # Collect every component's props from the serialized layout, keyed by id
+    components = {}
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict) and 'props' in node:
+            props = node['props']
+            if 'id' in props:
+                components[props['id']] = props
+            stack.append(props.get('children'))
+    return components
+
+
+def initial_values(layout):
+    values = {}
+    for component_id, props in find_components(layout).items():
+        for prop, value in props.items():
+            if prop in ('value', 'options', 'on'):
+                values[f'{component_id}.{prop}'] = value
+    return values
+
+
+# Typed-array dtypes plotly uses when it base64-encodes numpy data in figure JSON
+BDATA_TYPECODES = {'i1': 'b', 'u1': 'B', 'i2': 'h', 'u2': 'H', 'i4': 'i', 'u4': 'I', 'i8': 'q', 'u8': 'Q',
+                   'f4': 'f', 'f8': 'd'}
+
+
+def decode_array(value):
+    if isinstance(value, dict) and 'bdata' in value:
+        return array.array(BDATA_TYPECODES[value['dtype']], base64.b64decode(value['bdata'])).tolist()
+    return value or []
+
+
+def scatter_figure_points(figure):
+    # Every point as the browser would report it in clickData/selectedData, with the row id in customdata
+    points = []
+    for curve_number, trace in enumerate(figure.get('data', [])):
+        customdata = decode_array(trace.get('customdata'))
+        for point_index, hovertext in enumerate(decode_array(trace.get('hovertext'))):
+            point = {'curveNumber': curve_number, 'pointNumber': point_index, 'pointIndex': point_index,
+                     'hovertext': hovertext}
+            if point_index < len(customdata):
+                row_id = customdata[point_index]
+                point['customdata'] = row_id if isinstance(row_id, list) else [row_id]
+            points.append(point)
+    return points
+
+
+def option_values(options):
+    return [option['value'] if isinstance(option, dict) else option for option in options or []]
+
+
+class CallbackStats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.last_completed = None
+
+    def record(self, name, latency, status):
+        self.last_completed = time.monotonic()
+        self.latencies[name].append(latency)
+        self.statuses[name][status] += 1
+        if not 200 <= status < 300:
+            self.errors[name] += 1
+
+    def report(self, elapsed):
+        rows = []
+        for name in sorted(self.latencies, key=lambda n: -len(self.latencies[n])):
+            latencies = sorted(self.latencies[name])
+            rows.append({
+                'callback': name,
+                'requests': len(latencies),
+                'throughput': len(latencies) / elapsed,
+                'error_rate': self.errors[name] / len(latencies),
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': latencies[-1] * 1000,
+                'statuses': {str(status): count for status, count in sorted(self.statuses[name].items())},
+            })
+        return rows
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(q / 100 * (len(sorted_values) - 1)))]
+
+
+async def read_response(reader):
+    # Minimal HTTP/1.1 response parser on asyncio streams so the harness needs no extra dependencies
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Server closed the connection')
+    version, status = status_line.split(b' ', 2)[:2]
+    status = int(status)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if status in (204, 304) or status < 200:
+        body = b''
+    elif 'chunked' in headers.get('transfer-encoding', ''):
+        body = b''
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass  # Skip trailers
+                break
+            body += (await reader.readexactly(size + 2))[:-2]
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read()  # Delimited by the server closing the connection
+        headers['connection'] = 'close'
+    return status, body, version == b'HTTP/1.1' and headers.get('connection') != 'close'
+
+
+async def exchange(reader, writer, request):
+    try:
+        writer.write(request)
+        await writer.drain()
+        return await read_response(reader)
+    except BaseException:
+        writer.close()
+        raise
+
+
+class Session:
+    def __init__(self, host, port, callbacks, values, phases, timeout, rng):
+        self.host = host
+        self.port = port
+        self.callbacks = callbacks
+        self.values = dict(values)
+        self.phases = phases
+        self.loading = False
+        self.timeout = timeout
+        self.rng = rng
+        self.points = []
+        # Keep-alive connections reused across requests, as a browser does
+        self.idle = []
+        self.slots = asyncio.Semaphore(MAX_CONNECTIONS_PER_SESSION)
+
+    async def post(self, body):
+        data = json.dumps(body).encode()
+        request = (f'POST {CALLBACK_PATH} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+                   f'Content-Type: application/json\r\nContent-Length: {len(data)}\r\n'
+                   f'Connection: keep-alive\r\n\r\n').encode() + data
+        async with self.slots:
+            reused = bool(self.idle)
+            reader, writer = self.idle.pop() if reused else await asyncio.open_connection(self.host, self.port)
+            try:
+                status, payload, keep_alive = await exchange(reader, writer, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # The server dropped the idle connection; retry once on a fresh one like a browser would
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                status, payload, keep_alive = await exchange(reader, writer, request)
+            if keep_alive:
+                self.idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, payload
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+    def record(self, callback, started, start, status):
+        # Page loads and anything started during ramp-up are reported apart from the steady state, and
+        # requests still in flight when the measurement window closes are left out
+        stats = self.phases.stats_for(started, self.loading)
+        if stats is not None:
+            stats.record(callback.name, time.perf_counter() - start, status)
+
+    async def call(self, callback, changed):
+        started = time.monotonic()
+        start = time.perf_counter()
+        try:
+            status, payload = await asyncio.wait_for(self.post(callback.payload(self.values, changed)),
+                                                     self.timeout)
+        except (OSError, EOFError, asyncio.TimeoutError, ValueError, IndexError):
+            self.record(callback, started, start, 0)
+            return []
+        self.record(callback, started, start, status)
+        if status != 200:
+            return []
+
+        # Feed non-figure outputs back into the session so follow-up actions use realistic values
+        updated = []
+        try:
+            response = json.loads(payload).get('response', {})
+        except ValueError:
+            return []
+        for component_id, props in response.items():
+            for prop, value in props.items():
+                if prop != 'figure':
+                    self.values[f'{component_id}.{prop}'] = value
+                    updated.append(f'{component_id}.{prop}')
+                elif component_id == 'scatter-plot':
+                    self.points = scatter_figure_points(value)
+        return updated
+
+    def triggered_by(self, keys, source=None):
+        return [callback for callback in self.callbacks
+                if callback is not source and set(callback.inputs) & set(keys)]
+
+    async def dispatch(self, pending, changed):
+        # Fire callbacks like the Dash renderer: a callback waits while another pending callback still
+        # produces one of its inputs, and each response triggers the callbacks reading its outputs
+        changed = set(changed)
+        for _ in range(MAX_CASCADE_ROUNDS):
+            if not pending:
+                break
+            ready = [callback for callback in pending
+                     if not any(other is not callback and set(other.outputs) & set(callback.inputs)
+                                for other in pending)] or pending
+            results = await asyncio.gather(*(self.call(callback, changed) for callback in ready))
+            pending = [callback for callback in pending if callback not in ready]
+            for callback, updated in zip(ready, results):
+                changed.update(updated)
+                pending += [other for other in self.triggered_by(updated, callback) if other not in pending]
+
+    async def change(self, key, value):
+        self.values[key] = value
+        await self.dispatch(self.triggered_by([key]), [key])
+
+    def choose(self, key, count=1):
+        pool = option_values(self.values.get(key))
+        if not pool:
+            return []
+        return self.rng.sample(pool, min(count, len(pool)))
+
+    def pick(self, key):
+        return next(iter(self.choose(key)), None)
+
+    def scatter_points(self, count):
+        # Sampled from the last scatter figure this session received
+        return self.rng.sample(self.points, min(count, len(self.points)))
+
+    async def act(self, action):
+        rng = self.rng
+        if action == 'change_team':
+            await self.change('team-dropdown.value', self.pick('team-dropdown.options'))
+        elif action == 'highlight_player':
+            await self.change('highlight-player-dropdown.value', self.pick('player-dropdown.value'))
+        elif action == 'filter_teams':
+            await self.change('team-dropdown-2.value', self.choose('team-dropdown-2.options', rng.randint(1, 3)))
+        elif action == 'filter_positions':
+            await self.change('position-dropdown.value', self.choose('position-dropdown.options', rng.randint(1, 2)))
+        elif action == 'change_metric':
+            key = rng.choice(['metric_x-dropdown', 'metric_y-dropdown'])
+            await self.change(f'{key}.value', self.pick(f'{key}.options'))
+        elif action == 'suggested_axes':
+            await self.change('suggested-axes-dropdown.value', self.pick('suggested-axes-dropdown.options'))
+        elif action == 'toggle_barmode':
+            await self.change('barmode-switch.on', not self.values.get('barmode-switch.on', True))
+        elif action == 'click_point':
+            await self.change('scatter-plot.clickData', {'points': self.scatter_points(1)})
+        elif action == 'lasso_select':
+            await self.change('scatter-plot.selectedData', {'points': self.scatter_points(rng.randint(5, 200))})
+
+    async def run(self, deadline, think_time):
+        actions, weights = zip(*ACTION_WEIGHTS.items())
+        try:
+            # Page load fires every callback that is not marked prevent_initial_call
+            self.loading = True
+            await self.dispatch([callback for callback in self.callbacks if not callback.prevent_initial_call], [])
+            self.loading = False
+            while time.monotonic() < deadline:
+                await self.act(self.rng.choices(actions, weights)[0])
+                await asyncio.sleep(self.rng.expovariate(1 / think_time) if think_time > 0 else 0)
+        finally:
+            self.close()
+
+
+class Phases:
+    """Splits samples into the warm-up phase (ramp-up and page loads) and the steady-state window."""
+
+    def __init__(self, start, ramp_up, duration):
+        self.start = start
+        self.steady_start = start + ramp_up
+        self.deadline = self.steady_start + duration
+        self.warmup = CallbackStats()
+        self.steady = CallbackStats()
+
+    def stats_for(self, started, loading):
+        if loading or started < self.steady_start:
+            return self.warmup
+        if time.monotonic() <= self.deadline:
+            return self.steady
+        return None
+
+    def warmup_elapsed(self):
+        end = self.warmup.last_completed or self.steady_start
+        return max(end - self.start, 1e-9)
+
+
+async def run_load(args, callbacks, values):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+    phases = Phases(time.monotonic(), args.ramp_up, args.duration)
+
+    async def start_session(index):
+        await asyncio.sleep(args.ramp_up * index / max(args.sessions, 1))
+        session = Session(host, port, callbacks, values, phases, args.timeout, random.Random(args.seed + index))
+        await session.run(phases.deadline, args.think_time)
+
+    await asyncio.gather(*(start_session(i) for i in range(args.sessions)))
+    return phases
+
+
+def fetch_json(base_url, path, timeout):
+    with urllib.request.urlopen(base_url + path, timeout=timeout) as response:
+        return json.load(response)
+
+
+def wait_for_server(base_url, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode} before accepting requests')
+        try:
+            return fetch_json(base_url, LAYOUT_PATH, timeout=2)
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    raise RuntimeError(f'Server at {base_url} did not respond within {timeout} seconds')
+
+
+def print_report(title, rows, elapsed, sessions):
+    total = sum(row['requests'] for row in rows)
+    errors = sum(row['error_rate'] * row['requests'] for row in rows)
+    print(f'\n{title}: {sessions} sessions, {elapsed:.1f}s, {total} requests, {total / elapsed:.1f} req/s, '
+          f'{errors / total if total else 0:.2%} errors\n')
+    print(f'{"callback":<40}{"requests":>10}{"req/s":>9}{"errors":>9}{"p50 ms":>10}{"p95 ms":>10}'
+          f'{"p99 ms":>10}{"max ms":>10}')
+    for row in rows:
+        print(f'{row["callback"]:<40}{row["requests"]:>10}{row["throughput"]:>9.1f}{row["error_rate"]:>9.2%}'
+              f'{row["p50_ms"]:>10.1f}{row["p95_ms"]:>10.1f}{row["p99_ms"]:>10.1f}{row["max_ms"]:>10.1f}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test the KickStats Dash callback endpoint.')
+    parser.add_argument('--url', default='http://127.0.0.1:8068', help='Base URL of the running app')
+    parser.add_argument('--sessions', type=int, default=50, help='Number of concurrent virtual scouts')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run after ramp-up')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which sessions are started')
+    parser.add_argument('--think-time', type=float, default=1.0, help='Mean pause between actions in seconds')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for reproducible scripts')
+    parser.add_argument('--start-server', action='store_true', help='Start the app locally before the test')
+    parser.add_argument('--server-command', help='Command used with --start-server (defaults to app.run_server)')
+    parser.add_argument('--json', dest='json_path', help='Also write the per-callback report to this file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.url = args.url.rstrip('/')
+    process = None
+    if args.start_server:
+        parts = urlsplit(args.url)
+        command = shlex.split(args.server_command) if args.server_command else [
+            sys.executable, '-c',
+            f"from app import app; app.run_server(host='{parts.hostname}', port={parts.port or 80}, debug=False)"]
+        process = subprocess.Popen(command)
+
+    try:
+        layout = wait_for_server(args.url, timeout=120 if process else args.timeout, process=process)
+        callbacks = load_callbacks(fetch_json(args.url, DEPENDENCIES_PATH, args.timeout))
+        phases = asyncio.run(run_load(args, callbacks, initial_values(layout)))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    # Steady-state throughput is measured over exactly --duration seconds after ramp-up
+    report = {'sessions': args.sessions}
+    for phase, stats, elapsed in (('warm-up', phases.warmup, phases.warmup_elapsed()),
+                                  ('steady state', phases.steady, args.duration)):
+        rows = stats.report(elapsed)
+        print_report(phase, rows, elapsed, args.sessions)
+        report[phase] = {'elapsed': elapsed, 'callbacks': rows}
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()